@@ -1,23 +1,33 @@
-import configparser
 import fcntl
+import heapq
 from itertools import combinations
 import json
 import math
 import os
 import random
-import selectors
+import select
+import signal
 from subprocess import Popen, PIPE, STDOUT
-import time
 
-from configmanager import validate_configs_by_filename
+from configmanager import Config, validate_configs
+
+try:
+    from orjson import loads as json_loads # faster, if installed
+except ImportError:
+    from json import loads as json_loads
 
 
 NUM_ROUTERS = 100
 
+INFINITE_METRIC = 16
+
 
 FOLDER = 'test_configs'
 os.makedirs(FOLDER, exist_ok=True)
 
+# set TEST_SEED to repeat the same topologies and topology changes
+rng = random.Random(os.environ.get('TEST_SEED'))
+
 
 class Test:
     def __init__(self, neighbour_func, change_topology=None, topology_changes=1):
@@ -37,20 +47,24 @@ class Test:
 
 
 ports = iter(range(10000, 64000))
-def make_neighbours(p1, p2):
+def make_neighbours(p1, p2, metric=None):
     port1 = next(ports)
     port2 = next(ports)
-    metric = random.randint(1, 15)
+    if metric is None:
+        metric = rng.randint(1, 15)
     p1.add_neighbour(port1, port2, metric, p2)
     p2.add_neighbour(port2, port1, metric, p1)
 
 def fully_connected(processes):
-    for p1, p2 in combinations(processes, 2):
-        make_neighbours(p1, p2)
+    """Link every pair of processes, drawing all the metrics in one call."""
+    num_pairs = len(processes) * (len(processes) - 1) // 2
+    metrics = rng.choices(range(1, 16), k=num_pairs)
+    for (p1, p2), metric in zip(combinations(processes, 2), metrics):
+        make_neighbours(p1, p2, metric)
 
 def sparsely_connected(processes):
     rand_processes = list(processes)
-    random.shuffle(rand_processes)
+    rng.shuffle(rand_processes)
     for p1 in processes:
         num_neighbours = 0
         for p2 in rand_processes:
@@ -62,13 +76,13 @@ def sparsely_connected(processes):
 
 def change_topology(processes):
     processes = list(processes)
-    if random.choice([False, True]):
-        to_stop = random.sample(processes, len(processes)//2)
+    if rng.choice([False, True]):
+        to_stop = rng.sample(processes, len(processes)//2)
         print(f'stopping {len(to_stop)} processes randomly')
         for p in to_stop:
             p.stop()
     else:
-        to_start = random.sample(processes, len(processes)//2)
+        to_start = rng.sample(processes, len(processes)//2)
         print(f'starting {len(to_start)} processes randomly')
         for p in to_start:
             p.start()
@@ -85,6 +99,23 @@ test4 = Test(sparsely_connected, change_topology, 10)
 class ProcessManager:
     def __init__(self):
         self.processes_dict = {}
+        # daemon stdout and pidfds, watched for the whole run so fds are
+        # only (un)registered when a process starts, stops or exits
+        self.epoll = select.epoll()
+        self.fd_data = {} # {fd: (kind, process)}
+
+    def watch(self, fd, kind, process):
+        self.epoll.register(fd, select.EPOLLIN | select.EPOLLET)
+        self.fd_data[fd] = (kind, process)
+
+    def unwatch(self, fd):
+        if fd in self.fd_data:
+            self.epoll.unregister(fd)
+            del self.fd_data[fd]
+
+    def get_fd_data(self, fd):
+        """Return (kind, process) for a watched fd, or None."""
+        return self.fd_data.get(fd)
 
     def get_processes(self):
         return self.processes_dict.values()
@@ -102,6 +133,7 @@ class ProcessManager:
     def stop_processes(self):
         for p in self.get_processes():
             p.stop()
+            p.reap()
 
     def new_processes(self):
         self.stop_processes()
@@ -111,12 +143,13 @@ class ProcessManager:
     def setup_test(self, test):
         self.new_processes()
         test.make_neighbours(self.get_processes())
+        validate_configs([p.get_config() for p in self.get_processes()])
         self.write_configs()
-        validate_configs_by_filename([p.filename for p in self.get_processes()])
         self.start_processes()
 
     def change_test_topology(self, test):
         test.change_topology(self.get_processes())
+        topology_changed()
         for p in self.get_processes():
             p.clear_routing_table()
 
@@ -132,10 +165,15 @@ class Process:
         self.outputs = {}
         self.filename = f'{FOLDER}/autoconfig{self.routerid}.ini'
         self.process = None
+        self.pidfd = None
+        self.stdout_fd = None
+        self.stdout_buffer = bytearray()
         self.alive = False
 
         self.routing_table = None
-        self.routing_table_time = math.inf
+        self.routing_table_entries_dict = {}
+        self.routing_table_routes = {}
+        self.reported_converged = False
         self.have_checked_convergence = False
         self.converged = False
 
@@ -153,63 +191,129 @@ class Process:
         return self.outputs
 
 
+    def get_config(self):
+        """Return the Config this router's config file describes."""
+        outputs = {id: [port, metric] for id, [_, port, metric] in self.outputs.items()}
+        return Config(self.routerid, [int(port) for port in self.inputs], outputs)
+
+
     def write_config(self):
-        config = configparser.ConfigParser()
-        config['SETTINGS'] = {
-            'router-id': str(self.routerid),
-            'input-ports': ','.join(self.inputs),
-            'outputs': ','.join(f'{port}-{metric}-{id}' for id, [_, port, metric] in self.outputs.items())
-        }
+        outputs = ','.join(f'{port}-{metric}-{id}' for id, [_, port, metric] in self.outputs.items())
         with open(self.filename, 'w') as file:
-            config.write(file)
+            file.write(f"[SETTINGS]\nrouter-id = {self.routerid}\ninput-ports = {','.join(self.inputs)}\noutputs = {outputs}\n")
 
 
     def start(self):
-        """Start the process and make its stdout non-blocking."""
+        """Start the process and make its stdout non-blocking. A pidfd is
+        kept for the process which becomes readable once it exits.
+        """
         if not self.alive:
+            self.reap()
             self.alive = True
+            topology_changed()
             self.process = Popen(["python", "daemon.py", self.filename, "--autotesting"], stdout=PIPE, stderr=STDOUT)
-            fcntl.fcntl(self.process.stdout.fileno(), fcntl.F_SETFL, os.O_NONBLOCK)
+            self.stdout_fd = self.process.stdout.fileno()
+            self.stdout_buffer = bytearray()
+            fcntl.fcntl(self.stdout_fd, fcntl.F_SETFL, os.O_NONBLOCK)
+            self.pidfd = os.pidfd_open(self.process.pid)
+            processmanager.watch(self.stdout_fd, 'stdout', self)
+            processmanager.watch(self.pidfd, 'pidfd', self)
 
 
     def stop(self):
+        """Ask the process to exit. It is reaped by reap() once its pidfd
+        becomes readable.
+        """
+        if self.alive:
+            topology_changed()
+            processmanager.unwatch(self.stdout_fd)
         self.alive = False
-        self.process.kill()
-
+        if self.pidfd is not None:
+            signal.pidfd_send_signal(self.pidfd, signal.SIGTERM)
 
-    def get_stdout(self):
-        return self.process.stdout
 
-
-    def read_line(self):
-        line = self.process.stdout.readline()
-        if line:
-            line = line.decode().strip()
+    def reap(self):
+        """Wait for the process to exit and release its pidfd and stdout.
+        Marks the process as stopped if it exited by itself (crashed).
+        """
+        if self.pidfd is None:
+            return
+        if self.alive:
+            print(self, 'exited unexpectedly')
+            self.alive = False
+            topology_changed()
+        processmanager.unwatch(self.stdout_fd)
+        processmanager.unwatch(self.pidfd)
+        os.waitid(os.P_PIDFD, self.pidfd, os.WEXITED)
+        os.close(self.pidfd)
+        self.pidfd = None
+        self.process.stdout.close()
+
+
+    def drain(self):
+        """Read everything currently available from the daemon's stdout
+        and process each complete line, keeping any trailing partial line
+        until the rest arrives. Reads until the pipe is empty, as required
+        by edge-triggered epoll.
+        """
+        while True:
             try:
-                line = json.loads(line)
-            except json.decoder.JSONDecodeError as e:
-                print(self, 'decode error', line)
-                return
-            if type(line) != list:
-                print(self, 'received non-list', line)
-                return
+                data = os.read(self.stdout_fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self.stdout_buffer += data
+
+        *lines, self.stdout_buffer = self.stdout_buffer.split(b'\n')
+        for line in lines:
+            self.read_line(line)
+
+
+    def read_line(self, line):
+        """Process a routing table line from the daemon. Once its routing
+        table has been stable for a while, the daemon reports it as
+        {"type": "converged", "table": [...]} instead of a plain list.
+        """
+        try:
+            line = json_loads(line)
+        except json.decoder.JSONDecodeError as e:
+            print(self, 'decode error', line.decode(errors='replace').strip())
+            return
 
-            if line != self.routing_table:
-                self.routing_table = line
-                self.routing_table_time = time.time()
-                self.have_checked_convergence = False
-                self.converged = False
+        reported_converged = type(line) == dict and line.get('type') == 'converged'
+        if reported_converged:
+            line = line.get('table')
+        if type(line) != list:
+            print(self, 'received non-list', line)
+            return
+        self.reported_converged = reported_converged
+
+        if line != self.routing_table:
+            self.routing_table = line
+            self.routing_table_entries_dict = {routerid:metric for routerid, _, metric, _ in line}
+            self.routing_table_routes = {routerid:(nexthop, metric) for routerid, nexthop, metric, _ in line}
+            self.have_checked_convergence = False
+            self.converged = False
 
 
     def clear_routing_table(self):
         self.routing_table = None
-        self.routing_table_time = math.inf
+        self.routing_table_entries_dict = {}
+        self.routing_table_routes = {}
+        self.reported_converged = False
         self.have_checked_convergence = False
         self.converged = False
 
 
     def routing_table_entries(self):
-        return {routerid:metric for routerid, _, metric, _ in self.routing_table}
+        """Return {routerid: metric}, rebuilt only when the table changes."""
+        return self.routing_table_entries_dict
+
+
+    def route_to(self, dest):
+        """Return (next_hop, metric) to dest, or None if there is no route."""
+        return self.routing_table_routes.get(dest)
 
 
     def check_convergence(self):
@@ -222,71 +326,133 @@ class Process:
         if self.have_checked_convergence:
             return
 
-        # only check if routing table hasn't changed for 10 seconds
-        if time.time() - self.routing_table_time < 10:
+        # only check once the daemon reports its routing table is stable
+        if not self.reported_converged:
             return
 
         self.calculate_convergence()
 
 
     def calculate_convergence(self):
-        min_costs, parents = dijkstras(self.routerid)
+        min_costs, _ = dijkstras(self.routerid)
         routing_table_entries = self.routing_table_entries()
 
-        self.converged = True
-        for routerid, metric in min_costs.items():
-            if metric >= 16 or routerid == self.routerid:
-                continue
-
-            if routerid not in routing_table_entries:
-                self.converged = False
-                print(f'{self} not converged to router {routerid} (not in routing table, cost should be: {metric})')
-                print('Dijkstras path:', dijsktras_path(min_costs, parents, self.routerid, routerid))
-                print()
-                continue
-
+        expected = {routerid: metric for routerid, metric in min_costs.items()
+                    if metric < INFINITE_METRIC and routerid != self.routerid}
+        missing = expected.keys() - routing_table_entries.keys()
+        mismatched = [routerid for routerid in expected.keys() & routing_table_entries.keys()
+                      if routing_table_entries[routerid] != expected[routerid]]
+
+        self.converged = not missing and not mismatched
+        if not self.converged:
+            _, parents = dijkstras(self.routerid, want_prev=True)
+        for routerid in sorted(missing):
+            metric = expected[routerid]
+            print(f'{self} not converged to router {routerid} (not in routing table, cost should be: {metric})')
+            print('Dijkstras path:', dijsktras_path(min_costs, parents, self.routerid, routerid))
+            print()
+
+        for routerid in sorted(mismatched):
+            metric = expected[routerid]
             actual_metric = routing_table_entries[routerid]
-            if actual_metric != metric:
-                self.converged = False
-                print(f'{self} not converged to router {routerid} (current cost: {actual_metric}, should be: {metric})')
-                print('Dijkstras path:', dijsktras_path(min_costs, parents, self.routerid, routerid))
-                print('Current path:   ', end='')
-                print_actual_path(self.routerid, routerid)
-                print()
+            print(f'{self} not converged to router {routerid} (current cost: {actual_metric}, should be: {metric})')
+            print('Dijkstras path:', dijsktras_path(min_costs, parents, self.routerid, routerid))
+            print('Current path:   ', end='')
+            print_actual_path(self.routerid, routerid)
+            print()
 
         self.have_checked_convergence = True
 
 
-def dijkstras(source_id):
-    dist = {}
-    prev = {}
-    queue = []
-    for p in processmanager.get_alive_processes():
-        id = p.routerid
-        dist[id] = math.inf
-        prev[id] = None
-        queue.append(id)
-    assert source_id in dist
-    dist[source_id] = 0
-
-    while queue:
-        u = None
-        min_dist = math.inf
-        for v in queue:
-           if dist[v] <= min_dist:
-               u = v
-               min_dist = dist[v]
-        queue.remove(u)
-
-        u_neighbours = processmanager.get_process(u).get_neighbours()
-        for v, [process, _, metric] in u_neighbours.items():
-            if v not in queue:
-                continue
-
-            cost = dist[u] + metric
-            if cost <= dist[v]:
+_topology_version = 0
+_topology = None
+_shortest_paths = {} # {source_id: dist} for every alive router
+_shortest_paths_version = None
+
+def topology_changed():
+    """Invalidate the shortest paths table. Called whenever a router is
+    started/stopped or the test topology changes.
+    """
+    global _topology_version
+    _topology_version += 1
+
+
+def all_shortest_paths():
+    """Return the all-pairs shortest path costs for the current topology,
+    building them once per topology change. Distances are capped at the
+    RIP infinite metric since those routes are never compared.
+    """
+    global _topology, _shortest_paths, _shortest_paths_version
+    if _shortest_paths_version != _topology_version:
+        _topology = Topology(processmanager.get_alive_processes())
+        _shortest_paths = {}
+        for source, source_id in enumerate(_topology.ids):
+            dist, _ = _dijkstras(_topology, source)
+            _shortest_paths[source_id] = {id: min(cost, INFINITE_METRIC) for id, cost in zip(_topology.ids, dist)}
+        _shortest_paths_version = _topology_version
+    return _shortest_paths
+
+
+def dijkstras(source_id, want_prev=False):
+    """Return the (dist, prev) shortest paths from source_id to every
+    alive router. prev is only needed to print paths, so it is None
+    unless want_prev is set.
+    """
+    dist = all_shortest_paths()[source_id]
+    if not want_prev:
+        return dist, None
+
+    _, prev = _dijkstras(_topology, _topology.index[source_id], want_prev=True)
+    prev = {id: None if u is None else _topology.ids[u] for id, u in zip(_topology.ids, prev)}
+    return dist, prev
+
+
+class Topology:
+    """The links between alive routers in compressed sparse row form.
+    Routers are numbered 0..V-1 (ids[i] is the router-id of router i,
+    index[router-id] is i). The neighbours of router u are
+    indices[indptr[u]:indptr[u+1]], with the link metrics in the same
+    positions of weights.
+    """
+
+    def __init__(self, processes):
+        self.ids = [p.routerid for p in processes]
+        self.index = {id: i for i, id in enumerate(self.ids)}
+        self.indptr = [0]
+        self.indices = []
+        self.weights = []
+        for p in processes:
+            for v, [_, _, metric] in p.get_neighbours().items():
+                if v in self.index:
+                    self.indices.append(self.index[v])
+                    self.weights.append(metric)
+            self.indptr.append(len(self.indices))
+
+
+def _dijkstras(topology, source, want_prev=False):
+    """Return (dist, prev) lists indexed by router index. prev is None
+    unless want_prev is set.
+    """
+    indptr, indices, weights = topology.indptr, topology.indices, topology.weights
+    heappop, heappush = heapq.heappop, heapq.heappush
+    dist = [math.inf] * len(topology.ids)
+    prev = [None] * len(topology.ids) if want_prev else None
+    dist[source] = 0
+
+    heap = [(0, source)]
+    while heap:
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue # stale heap entry, u was already reached more cheaply
+
+        for k in range(indptr[u], indptr[u+1]):
+            v = indices[k]
+            cost = d + weights[k]
+            if cost < dist[v]:
                 dist[v] = cost
-                prev[v] = u
+                if want_prev:
+                    prev[v] = u
+                heappush(heap, (cost, v))
 
     return dist, prev
 
@@ -300,23 +466,26 @@ def dijsktras_path(dist, prev, src, dest):
     return path
 
 
-def print_actual_path(src, dest, depth=0):
-    if depth > 15:
-        print('ABORTING')
-        return
-    if src == dest:
-        print(f'{src} (0)')
-        return
-
-    src_routing_table = processmanager.get_process(src).routing_table
-    if src_routing_table == None:
-        print(f'{src} (no route to {dest})')
-        return
-    for routerid, nexthop, metric, _ in src_routing_table:
-        if routerid == dest:
+def print_actual_path(src, dest):
+    """Print the path to dest followed through each router's routing
+    table. A path of 16 or more hops can't have a metric below 16.
+    """
+    path = []
+    current = src
+    for _ in range(INFINITE_METRIC):
+        if current == dest:
+            path.append(f'{dest} (0)')
             break
-    print(f'{src} ({metric}) --> ', end='')
-    print_actual_path(nexthop, dest, depth+1)
+        route = processmanager.get_process(current).route_to(dest)
+        if route is None:
+            path.append(f'{current} (no route to {dest})')
+            break
+        next_hop, metric = route
+        path.append(f'{current} ({metric})')
+        current = next_hop
+    else:
+        path.append('ABORTING')
+    print(' --> '.join(path))
 
 
 processmanager = ProcessManager()
@@ -336,26 +505,31 @@ def main():
 
 
 def run_to_convergence():
-    selector = selectors.DefaultSelector()
-    for p in processmanager.get_processes():
-        selector.register(p.get_stdout(), selectors.EVENT_READ, p)
-
+    """Wait for all routers to converge. Daemon stdout and pidfds are
+    watched with edge-triggered epoll, so each event drains its pipe.
+    """
     prev_not_converged = []
     while True:
-        events = selector.select(timeout=1)
-        for key, _ in events:
-            p = key.data
-            p.read_line()
-
-        all_converged = True
-        not_converged = []
-        for p in processmanager.get_processes():
-            p.check_convergence()
-            if not p.converged:
-                all_converged = False
-                not_converged.append(p.routerid)
-
-        if all_converged:
+        events = processmanager.epoll.poll(timeout=1)
+        for fd, _ in events:
+            fd_data = processmanager.get_fd_data(fd)
+            if fd_data is None:
+                continue # unwatched earlier in this batch
+            kind, p = fd_data
+            if kind == 'pidfd':
+                p.reap()
+            else:
+                p.drain()
+
+        # only check routing tables against dijkstras once every alive
+        # daemon reports that its routing table is stable
+        not_converged = [p.routerid for p in processmanager.get_alive_processes() if not p.reported_converged]
+        if not not_converged:
+            for p in processmanager.get_processes():
+                p.check_convergence()
+            not_converged = [p.routerid for p in processmanager.get_processes() if not p.converged]
+
+        if not not_converged:
             print('all routers converged correctly')
             return
         elif not_converged != prev_not_converged:
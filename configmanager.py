@@ -1,5 +1,18 @@
+from collections import Counter
 import configparser
-from itertools import combinations
+import re
+
+
+PORT_RE = re.compile(r'\s*(\d+)\s*')
+OUTPUT_RE = re.compile(r'\s*(\d+)\s*-\s*(\d+)\s*-\s*(\d+)\s*')
+
+MIN_ROUTERID, MAX_ROUTERID = 1, 64000
+MIN_PORT, MAX_PORT = 1024, 64000
+MIN_METRIC, MAX_METRIC = 1, 16
+
+ROUTER_ID_ERROR = 'router-id must be a number between 1 and 64000. Got "{}"'
+PORT_ERROR = 'port must be a number between 1024 and 64000. Got "{}"'
+METRIC_ERROR = 'metric must be a number between 1 and 16. Got "{}"'
 
 
 class Config:
@@ -20,14 +33,60 @@ class Config:
 
 
 def read_config_file(filename):
-    config = configparser.ConfigParser()
-    config.read(filename)
+    config = read_simple_config_file(filename)
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read(filename)
     try:
         return get_config(config)
     except ValueError as e:
         raise ValueError(f'CONFIG {filename} ERROR: {e}')
 
 
+def read_simple_config_file(filename):
+    """Read a config file without configparser if it only contains the
+    SETTINGS header and its parameters (as written by automatic testing).
+    Return None if the file is anything else, so configparser can handle it.
+    """
+    try:
+        with open(filename) as file:
+            return parse_simple_config(file.read())
+    except OSError:
+        return None
+
+
+def parse_simple_config(text):
+    """
+    >>> parse_simple_config('[SETTINGS]\\nrouter-id = 2\\ninput-ports = 2000\\noutputs = 3000-1-3\\n')
+    {'SETTINGS': {'router-id': '2', 'input-ports': '2000', 'outputs': '3000-1-3'}}
+    >>> parse_simple_config('[SETTINGS]\\n\\nROUTER-ID=2\\n')
+    {'SETTINGS': {'router-id': '2'}}
+    >>> parse_simple_config('# comment\\n[SETTINGS]\\nrouter-id = 2\\n') is None
+    True
+    >>> parse_simple_config('[SETTINGS]\\nrouter-id = 2\\nrouter-id = 3\\n') is None
+    True
+    >>> parse_simple_config('router-id = 2\\n') is None
+    True
+    >>> parse_simple_config('[SETTINGS]\\nrouter-id = 2\\n  input-ports = 2000\\n') is None
+    True
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    if any(line[0].isspace() for line in lines):
+        return None # configparser reads indented lines as continuations of the previous value
+    lines = [line.strip() for line in lines]
+    if not lines or lines[0] != '[SETTINGS]':
+        return None
+
+    settings = {}
+    for line in lines[1:]:
+        param, sep, value = line.partition('=')
+        param = param.strip().lower()
+        if not sep or param not in ['router-id', 'input-ports', 'outputs'] or param in settings:
+            return None
+        settings[param] = value.strip()
+    return {'SETTINGS': settings}
+
+
 def get_config(config):
     """
     >>> config = configparser.ConfigParser()
@@ -99,8 +158,9 @@ def validate_configs(configs):
     >>> config3['SETTINGS'] = {'router-id':'4','input-ports':'4000,4001','outputs':'2001-2-2,3001-3-3'}
     >>> validate_configs([get_config(config1), get_config(config2), get_config(config3)])
     """
-    for c1, c2 in combinations(configs, 2):
-        assert c1.router_id != c2.router_id, f'same router-id: {c1.router_id}'
+    router_id_counts = Counter(config.router_id for config in configs)
+    duplicate_ids = [id for id, count in router_id_counts.items() if count > 1]
+    assert not duplicate_ids, f'same router-id: {duplicate_ids[0]}'
 
     port_ids = {} # {port: [input_id, output_id]}
     metrics = {}  # {(router1_id, router2_id), metric]} # where router1_id < router2_id
@@ -130,7 +190,7 @@ def validate_configs(configs):
 
 
 def routerid_is_valid(routerid):
-    return  1 <= routerid <= 64000
+    return MIN_ROUTERID <= routerid <= MAX_ROUTERID
 
 def validate_router_id(routerid):
     """
@@ -149,11 +209,11 @@ def validate_router_id(routerid):
     if routerid.isdigit() and routerid_is_valid(int(routerid)):
         return int(routerid)
     else:
-        raise ValueError(f'router-id must be a number between 1 and 64000. Got "{routerid}"')
+        raise ValueError(ROUTER_ID_ERROR.format(routerid))
 
 
 def port_is_valid(port):
-    return 1024 <= port <= 64000
+    return MIN_PORT <= port <= MAX_PORT
 
 def validate_port(port):
     """
@@ -172,11 +232,11 @@ def validate_port(port):
     if port.isdigit() and port_is_valid(int(port)):
         return int(port)
     else:
-        raise ValueError(f'port must be a number between 1024 and 64000. Got "{port}"')
+        raise ValueError(PORT_ERROR.format(port))
 
 
 def metric_is_valid(metric):
-    return 1 <= metric <= 16
+    return MIN_METRIC <= metric <= MAX_METRIC
 
 def validate_metric(metric):
     """
@@ -195,7 +255,7 @@ def validate_metric(metric):
     if metric.isdigit() and metric_is_valid(int(metric)):
         return int(metric)
     else:
-        raise ValueError(f'metric must be a number between 1 and 16. Got "{metric}"')
+        raise ValueError(METRIC_ERROR.format(metric))
 
 
 def validate_config(config):
@@ -230,6 +290,36 @@ def validate_config(config):
     Traceback (most recent call last):
     ValueError: "2000" is already defined as an input port
 
+    >>> config['SETTINGS'] = {'router-id':'1','input-ports':'1024','outputs':'5000-1'}
+    >>> validate_config(config)
+    Traceback (most recent call last):
+    ValueError: output must be in the form port-metric-routerid. Got "5000-1"
+
+    >>> config['SETTINGS'] = {'router-id':'1','input-ports':'1024, x','outputs':'5000-1-2'}
+    >>> validate_config(config)
+    Traceback (most recent call last):
+    ValueError: port must be a number between 1024 and 64000. Got "x"
+
+    >>> config['SETTINGS'] = {'router-id':'1','input-ports':'1024','outputs':'5000-x-2'}
+    >>> validate_config(config)
+    Traceback (most recent call last):
+    ValueError: metric must be a number between 1 and 16. Got "x"
+
+    >>> config['SETTINGS'] = {'router-id':'1','input-ports':'1024','outputs':'x-1-2'}
+    >>> validate_config(config)
+    Traceback (most recent call last):
+    ValueError: port must be a number between 1024 and 64000. Got "x"
+
+    >>> config['SETTINGS'] = {'router-id':'1','input-ports':'1024','outputs':'5000-1-abc'}
+    >>> validate_config(config)
+    Traceback (most recent call last):
+    ValueError: router-id must be a number between 1 and 64000. Got "abc"
+
+    >>> config['SETTINGS'] = {'router-id':'1','input-ports':'1024','outputs':'5000-17-2'}
+    >>> validate_config(config)
+    Traceback (most recent call last):
+    ValueError: metric must be a number between 1 and 16. Got "17"
+
     >>> config['SETTINGS'] = {'router-id':'1','input-ports':'1024','outputs':'64000-1-1'}
     >>> validate_config(config)
     (1, [1024], {1: [64000, 1]})
@@ -254,23 +344,45 @@ def validate_config(config):
 
     input_ports_str = config['SETTINGS']['input-ports'].split(',')
     input_ports = []
-    for port in input_ports_str:
-        port = validate_port(port)
-        if port in input_ports:
+    input_ports_set = set() # for fast membership checks, input_ports keeps the order
+    for port_str in input_ports_str:
+        match = PORT_RE.fullmatch(port_str)
+        port = int(match[1]) if match else None
+        if port is None or not port_is_valid(port):
+            raise ValueError(PORT_ERROR.format(port_str.strip()))
+        if port in input_ports_set:
             raise ValueError(f'"{port}" is a duplicate port number')
         else:
             input_ports.append(port)
+            input_ports_set.add(port)
 
     outputs_str = config['SETTINGS']['outputs'].split(',')
     outputs = {}
     for output in outputs_str:
-        port, metric, out_routerid = output.strip().split('-')
-
-        port = validate_port(port)
-        if port in input_ports:
-            raise ValueError(f'"{port}" is already defined as an input port')
-        metric = validate_metric(metric)
-        out_routerid = validate_router_id(out_routerid)
+        match = OUTPUT_RE.fullmatch(output)
+        if match:
+            port_str, metric_str, routerid_str = match.groups()
+            port, metric, out_routerid = int(port_str), int(metric_str), int(routerid_str)
+
+            if not port_is_valid(port):
+                raise ValueError(PORT_ERROR.format(port_str))
+            if port in input_ports_set:
+                raise ValueError(f'"{port}" is already defined as an input port')
+            if not metric_is_valid(metric):
+                raise ValueError(METRIC_ERROR.format(metric_str))
+            if not routerid_is_valid(out_routerid):
+                raise ValueError(ROUTER_ID_ERROR.format(routerid_str))
+        else:
+            # not all digits, validate each field to report which one is wrong
+            fields = output.strip().split('-')
+            if len(fields) != 3:
+                raise ValueError(f'output must be in the form port-metric-routerid. Got "{output.strip()}"')
+            port_str, metric_str, routerid_str = fields
+            port = validate_port(port_str)
+            if port in input_ports_set:
+                raise ValueError(f'"{port}" is already defined as an input port')
+            metric = validate_metric(metric_str)
+            out_routerid = validate_router_id(routerid_str)
 
         outputs[out_routerid] = [port, metric]
 
@@ -12,10 +12,17 @@ import socket
 import time
 
 from configmanager import read_config_file
-from ripmanager import RipManager
+from ripmanager import RipManager, MAX_PACKET_SIZE
 
+try:
+    import orjson # faster, if installed
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    json_dumps = json.dumps
 
-MAX_PACKET_SIZE = 4 + 20 * 25 # header + rip entry * max number of rip entries
+
+CONVERGED_DELAY = 10 # seconds the routing table must be unchanged to report convergence
 
 
 parser = argparse.ArgumentParser()
@@ -43,9 +50,11 @@ def main():
 
     rip = RipManager(debug, config, sockets[0])
 
-    next_print_time = time.time()
+    next_print_time = time.monotonic()
+    last_table = None
+    last_table_change = time.monotonic()
     while True:
-        next_print = max(0, next_print_time - time.time())
+        next_print = max(0, next_print_time - time.monotonic())
         next_timeout = min(next_print, rip.next_timeout())
         events = selector.select(timeout=next_timeout)
 
@@ -55,17 +64,27 @@ def main():
             rip.incoming_message(message)
         rip.send_any_updates()
 
-        if time.time() >= next_print_time:
-            next_print_time = time.time() + 1
+        if time.monotonic() >= next_print_time:
+            next_print_time = time.monotonic() + 1
             if args.autotesting:
-                print(json.dumps(rip.table_list()))
+                table = rip.table_list()
+                if table != last_table:
+                    last_table = table
+                    last_table_change = time.monotonic()
+                if time.monotonic() - last_table_change >= CONVERGED_DELAY:
+                    print(json_dumps({"type": "converged", "table": table}))
+                else:
+                    print(json_dumps(table))
             else:
                 print(rip)
 
 
-def debug(line):
+def debug(line, *values):
+    """Print a debugging line, %-formatted with values only when
+    debugging is enabled.
+    """
     if args.debug:
-        print(line)
+        print(line % values if values else line)
 
 
 def get_sockets(config):
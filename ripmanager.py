@@ -1,8 +1,13 @@
+import heapq
+from itertools import count
 import math
+import os
 import random
+import struct
 import time
 
-from configmanager import routerid_is_valid, metric_is_valid
+from configmanager import MIN_ROUTERID, MAX_ROUTERID, MIN_METRIC, MAX_METRIC
+from sendmmsg import send_all
 
 
 TIME_MULTIPLIER = 6
@@ -12,56 +17,88 @@ TRIGGERED_UPDATE_DELAY =    5 / TIME_MULTIPLIER
 ENTRY_TIMEOUT_DELAY =       180 / TIME_MULTIPLIER
 GARBAGE_COLLECTION_DELAY =  120 / TIME_MULTIPLIER
 
+# periodic updates are every 30 seconds +/- 5 seconds (1/6th of 30s),
+# triggered updates are 1 (1/5th of 5 seconds) to 5 seconds apart
+PERIODIC_UPDATE_MIN_DELAY =     PERIODIC_UPDATE_DELAY * 5/6
+PERIODIC_UPDATE_JITTER =        PERIODIC_UPDATE_DELAY * 2/6
+TRIGGERED_UPDATE_MIN_DELAY =    TRIGGERED_UPDATE_DELAY / 5
+TRIGGERED_UPDATE_JITTER =       TRIGGERED_UPDATE_DELAY - TRIGGERED_UPDATE_MIN_DELAY
+
 
 INFINITE_METRIC = 16
 
 POISONED_REVERSE = True
 
+# parse packets before sending them, enabled by running with RIP_VALIDATE_OUTGOING=1
+VALIDATE_OUTGOING = os.environ.get('RIP_VALIDATE_OUTGOING', '') not in ('', '0')
+
+
+HEADER_STRUCT = struct.Struct('>BBH') # command, version, routerid
+ENTRY_STRUCT = struct.Struct('>HHIQI') # address family, zeros, routerid, zeros, metric
+METRIC_STRUCT = struct.Struct('>I') # metric field, ENTRY_METRIC_OFFSET bytes into an entry
+ENTRY_METRIC_OFFSET = 16
+
+MAX_PACKET_SIZE = 4 + 20 * 25 # header + rip entry * max number of rip entries
+
 
 class RipManager:
     """This class manages the Routing Information Protocol. The routing
     table is a dictionary where the key is the destination and the value
     is a RoutingTableEntry. e.g. {destination: RoutingTableEntry}
     A RoutingTableEntry contains info about the next_hop, metric, and timeouts.
+    Entry timeouts are kept in a heap of (deadline, tiebreak, destination,
+    entry) timers. Each entry has one live timer, at entry.timer_due.
+    Replaced timers and timers of deleted entries are not removed, they
+    are skipped when they expire.
     """
 
     def __init__(self, debug_func, config, output_socket):
+        """debug_func(line, *values) prints line % values when debugging
+        is enabled, so the message is only formatted if it is printed.
+        """
         global debug
         debug = debug_func
         self.our_routerid = config.router_id
         self.output_routers = config.outputs
         self.socket = output_socket
+        self.header = HEADER_STRUCT.pack(2, 2, self.our_routerid) # command, version, routerid
+        self.empty_packet = self.header + bytes(MAX_PACKET_SIZE - 4) # copied to start each packet
 
         self.routing_table = {}
-        self.next_periodic_update = time.time()
+        self.timers = []
+        self.timer_tiebreak = count() # entries can't be compared, so timers must never tie
+        self.next_periodic_update = time.monotonic()
         self.triggered_update_pending = False
         self.next_triggered_update = 0
 
 
     def __str__(self):
-        lines = f'''Router {self.our_routerid:<16} Routing Table
-+-------------+----------+--------+------------+--------------+
-| destination | next hop | metric | update due | deletion due |
-+-------------+----------+--------+------------+--------------+
-'''
+        border = '+-------------+----------+--------+------------+--------------+'
+        lines = [f'Router {self.our_routerid:<16} Routing Table',
+                 border,
+                 '| destination | next hop | metric | update due | deletion due |',
+                 border]
+        now = time.monotonic()
         for dest, entry in sorted(self.routing_table.items()):
-            deletion_due = entry.deletion_due_in()
+            deletion_due = entry.deletion_due_in(now)
             if deletion_due == math.inf:
                 deletion_due = ''
             else:
                 deletion_due = int(deletion_due)
-            lines += f'| {dest:>11} | {entry.next_hop:>8} | {entry.metric:>6} '
-            lines += f'| {entry.update_due_in():>10.0f} | {deletion_due:>12} |\n'
-        lines += '+-------------+----------+--------+------------+--------------+\n'
-        return lines
+            lines.append(f'| {dest:>11} | {entry.next_hop:>8} | {entry.metric:>6} '
+                         f'| {entry.update_due_in(now):>10.0f} | {deletion_due:>12} |')
+        lines.append(border)
+        return '\n'.join(lines) + '\n'
 
 
     def table_list(self):
         """Return a list of routing table entries. Does not include
         timeout times, but does include a deletion process flag.
         Used for automatic testing and to detect routing table changes.
+        Entries are in insertion order rather than sorted, a route that
+        is deleted and re-added moves to the end of the list.
         """
-        return [[d, e.next_hop, e.metric, e.deletion_process_underway()] for d,e in sorted(self.routing_table.items())]
+        return [[d, e.next_hop, e.metric, e.deletion_process_underway()] for d,e in self.routing_table.items()]
 
 
     def next_timeout(self):
@@ -72,42 +109,67 @@ class RipManager:
         180 seconds, or if a routing table entry has been garbage
         collected for 120 seconds.
         """
-        next_periodic_update_in = self.next_periodic_update - time.time()
-        next_periodic_update_in = max(0, next_periodic_update_in)
-
-        timeouts = [next_periodic_update_in]
-        for entry in self.routing_table.values():
-            timeouts.append(entry.next_timeout())
-
-        if self.triggered_update_pending:
-            next_triggered_update_in = self.next_triggered_update - time.time()
-            timeouts.append(next_triggered_update_in)
-
-        smallest_timeout = min(timeouts)
-        return max(0, smallest_timeout)
+        smallest_deadline = self.next_periodic_update
+        if self.triggered_update_pending and self.next_triggered_update < smallest_deadline:
+            smallest_deadline = self.next_triggered_update
+        if self.timers and self.timers[0][0] < smallest_deadline:
+            smallest_deadline = self.timers[0][0]
+
+        return max(0, smallest_deadline - time.monotonic())
+
+
+    def schedule_timer(self, destination, entry, deadline):
+        """Set the entry's timer to deadline. If skipped timers make up
+        most of the heap, rebuild it from the live timers so the heap
+        stays bounded by the size of the routing table.
+
+        >>> from configmanager import Config
+        >>> rip = RipManager(lambda *a: None, Config(1, [1024], {}), None)
+        >>> for now in range(2000): # route to 2 flaps, 3 and 4 are stable
+        ...     rip.add_to_table(2, 2, 16 if now % 2 else 2, now)
+        ...     rip.add_to_table(3, 3, 1, now)
+        ...     rip.add_to_table(4, 3, 2, now)
+        ...     rip.send_any_updates(now)
+        ...     assert len(rip.timers) <= 2 * len(rip.routing_table) + 1
+        >>> sorted(rip.routing_table)
+        [2, 3, 4]
+        """
+        timers = self.timers
+        if len(timers) > 2 * len(self.routing_table):
+            routing_table = self.routing_table
+            timers[:] = [timer for timer in timers # in place, callers may hold the list
+                         if routing_table.get(timer[2]) is timer[3] and timer[0] == timer[3].timer_due]
+            heapq.heapify(timers)
+        entry.timer_due = deadline
+        heapq.heappush(timers, (deadline, next(self.timer_tiebreak), destination, entry))
 
 
     def incoming_message(self, message):
         """Process an incoming UDP packet."""
         try:
-            rip_packet = RipPacket(message)
+            next_hop, entries = decode_packet(message)
         except AssertionError as e:
-            debug(f"Received invalid packet: {e}")
+            debug("Received invalid packet: %s", e)
             return
 
-        next_hop = rip_packet.routerid
-        if next_hop not in self.output_routers:
-            debug(f'Received packet from unknown router {next_hop}')
+        neighbour = self.output_routers.get(next_hop)
+        if neighbour is None:
+            debug('Received packet from unknown router %s', next_hop)
             return
-        _, metric_to_next_hop = self.output_routers[next_hop]
-        self.add_to_table(next_hop, next_hop, metric_to_next_hop) # add sender to routing table
+        _, metric_to_next_hop = neighbour
+        now = time.monotonic()
+        self.add_to_table(next_hop, next_hop, metric_to_next_hop, now) # add sender to routing table
 
-        for rip_entry in rip_packet.entries:
-            metric = min(metric_to_next_hop + rip_entry.metric, INFINITE_METRIC)
-            self.add_to_table(rip_entry.routerid, next_hop, metric)
+        add_to_table = self.add_to_table
+        infinite_metric = INFINITE_METRIC
+        for destination, entry_metric in entries:
+            metric = metric_to_next_hop + entry_metric
+            if metric > infinite_metric:
+                metric = infinite_metric
+            add_to_table(destination, next_hop, metric, now)
 
 
-    def add_to_table(self, destination, next_hop, metric):
+    def add_to_table(self, destination, next_hop, metric, now):
         """Update or add a table entry.
         Only add a new entry if the metric isn't infinity.
         The RIP assignment says to not send a triggered message for
@@ -115,44 +177,59 @@ class RipManager:
         """
         if destination == self.our_routerid:
             return # don't add ourself to our routing table
-        if destination in self.routing_table.keys():
-            reason = self.routing_table[destination].update_entry(next_hop, metric)
+        entry = self.routing_table.get(destination)
+        if entry is not None:
+            reason = entry.update_entry(next_hop, metric, now)
             if reason:
-                debug(f'{self.our_routerid} updating routing table entry for destination {destination}:')
-                debug(f'    {reason}')
+                debug('%s updating routing table entry for destination %s:', self.our_routerid, destination)
+                debug('    %s', reason)
+            if entry.should_begin_deletion(now) and now < entry.timer_due:
+                self.schedule_timer(destination, entry, now) # metric became infinite
         elif metric < INFINITE_METRIC:
-            debug(f'{self.our_routerid} added a new route to destination {destination} next-hop {next_hop} metric {metric}')
-            self.routing_table[destination] = RoutingTableEntry(next_hop, metric)
+            debug('%s added a new route to destination %s next-hop %s metric %s',
+                  self.our_routerid, destination, next_hop, metric)
+            entry = RoutingTableEntry(next_hop, metric, now)
+            self.routing_table[destination] = entry
+            self.schedule_timer(destination, entry, entry.next_deadline())
 
 
-    def send_any_updates(self):
+    def send_any_updates(self, now=None):
         """Check if a periodic or triggered update should be sent.
         Triggered updates only for when routes become invalid (route
         deleted or metric set to 16), not for new/updated routes.
         After sending a triggered update, don't send future triggered
         updates for 1 to 5 seconds.
+        Only expired timers are looked at, so when no entry is due to
+        time out this is a single comparison against the earliest timer.
         """
-        to_delete = []
-        for destination, entry in self.routing_table.items():
-            if entry.should_delete():
-                to_delete.append(destination)
+        if now is None:
+            now = time.monotonic()
+        timers = self.timers
+        routing_table = self.routing_table
+        while timers and timers[0][0] <= now:
+            deadline, _, destination, entry = heapq.heappop(timers)
+            if routing_table.get(destination) is not entry or deadline != entry.timer_due:
+                continue # entry has since been deleted, or the timer replaced
+
+            if entry.should_delete(now):
+                debug('Deleting destination %s', destination)
+                del routing_table[destination]
                 self.triggered_update_pending = True
-            elif entry.should_begin_deletion():
-                debug(f'Starting deletion process for destination {destination}')
-                entry.begin_deletion()
+            elif entry.should_begin_deletion(now):
+                debug('Starting deletion process for destination %s', destination)
+                entry.begin_deletion(now)
+                self.schedule_timer(destination, entry, entry.next_deadline())
                 self.triggered_update_pending = True
+            else:
+                self.schedule_timer(destination, entry, entry.next_deadline()) # deadline was extended
 
-        for dest in to_delete: # since you cant delete entries while iterating over them
-            debug(f'Deleting destination {dest}')
-            del self.routing_table[dest]
-
-        periodic_update = time.time() >= self.next_periodic_update
-        triggered_update = self.triggered_update_pending and time.time() >= self.next_triggered_update
+        periodic_update = now >= self.next_periodic_update
+        triggered_update = self.triggered_update_pending and now >= self.next_triggered_update
         if periodic_update or triggered_update:
-            self.send_response_messages()
+            self.send_response_messages(now)
 
 
-    def send_response_messages(self):
+    def send_response_messages(self, now):
         """Send a periodic/triggered update message.
         Send a response message to all neighbours
         containing the complete routing table (as set by assignment
@@ -162,31 +239,93 @@ class RipManager:
         The next triggered update message should be sent in
         1 (1/5th of 5 seconds) to 5 seconds randomly.
         """
-        for router_id, [port, metric] in self.output_routers.items():
-            packets = self.build_packets(router_id)
-            for p in packets:
+        messages = [] # [(packet, address)] sent together in one batch
+        if POISONED_REVERSE:
+            # every neighbour is sent the same packets apart from the
+            # receiver entry and the entries poisoned for it, so build
+            # them once and patch them for each neighbour
+            packets, poisoned = self.build_shared_packets()
+            for router_id, [port, metric] in self.output_routers.items():
+                ENTRY_STRUCT.pack_into(packets[0], 4, 2, 0, router_id, 0, INFINITE_METRIC)
+                for packet, offset, _ in poisoned.get(router_id, []):
+                    METRIC_STRUCT.pack_into(packet, offset, INFINITE_METRIC)
+                self.queue_packets(messages, packets, port)
+                for packet, offset, entry_metric in poisoned.get(router_id, []):
+                    METRIC_STRUCT.pack_into(packet, offset, entry_metric)
+        else:
+            buffer = bytearray(MAX_PACKET_SIZE) # reused to build every packet
+            for router_id, [port, metric] in self.output_routers.items():
+                self.queue_packets(messages, self.build_packets(router_id, buffer), port)
+        send_all(self.socket, messages)
+
+        self.next_periodic_update = (now +
+            PERIODIC_UPDATE_MIN_DELAY + PERIODIC_UPDATE_JITTER * random.random())
+        self.triggered_update_pending = False
+        self.next_triggered_update = (now +
+            TRIGGERED_UPDATE_MIN_DELAY + TRIGGERED_UPDATE_JITTER * random.random())
+
+
+    def queue_packets(self, messages, packets, port):
+        """Add packets for the router on port to messages. The packets
+        are copied, as shared packets are patched for the next neighbour.
+        """
+        address = ('127.0.0.1', port)
+        for p in packets:
+            if VALIDATE_OUTGOING:
                 try:
                     RipPacket(p)
                 except AssertionError as e:
-                    debug(f'Sending invalid packet: {e}')
-                self.socket.sendto(p, ('127.0.0.1', port))
+                    debug('Sending invalid packet: %s', e)
+            messages.append((bytes(p), address))
 
-        self.next_periodic_update = (time.time() +
-            PERIODIC_UPDATE_DELAY +
-            random.uniform(-PERIODIC_UPDATE_DELAY/6, PERIODIC_UPDATE_DELAY/6))
-        self.triggered_update_pending = False
-        self.next_triggered_update = (time.time() +
-            random.uniform(TRIGGERED_UPDATE_DELAY/5, TRIGGERED_UPDATE_DELAY))
 
+    def build_shared_packets(self):
+        """Return (packets, poisoned) containing the whole routing table,
+        for sending to any neighbour with poisoned-reverse.
+        The first entry of the first packet is for the receiver and its
+        routerid must be filled in before sending. poisoned is
+        {next_hop: [(packet, metric_offset, metric)]}, the entries that
+        must have their metric set to infinity when sending to next_hop.
+        RFC all-zeros field is used for the routerid by assignment specs.
+        """
+        pack_entry = ENTRY_STRUCT.pack_into
+        packets = []
+        poisoned = {}
+
+        packet = bytearray(self.empty_packet)
+        pack_entry(packet, 4, 2, 0, 0, 0, INFINITE_METRIC) # receiver entry
+        offset = 4 + 20
+
+        for destination, entry in self.routing_table.items():
+            if offset == MAX_PACKET_SIZE: # if 25 entries
+                packets.append(packet)
+                packet = bytearray(self.empty_packet)
+                offset = 4
+
+            pack_entry(packet, offset, 2, 0, destination, 0, entry.metric)
+            poisoned.setdefault(entry.next_hop, []).append((packet, offset + ENTRY_METRIC_OFFSET, entry.metric))
+            offset += 20
+
+        del packet[offset:]
+        packets.append(packet)
+        return packets, poisoned
 
-    def build_packets(self, destination_router_id):
+
+    def build_packets(self, destination_router_id, buffer=None):
         """Return response message packets to be sent to the defined
         router. Utilises split-horizon with optional poisoned-reverse.
+        Packets are built in buffer (a MAX_PACKET_SIZE bytearray) and
+        copied out when complete.
+        RFC all-zeros field is used for the routerid by assignment specs.
         """
+        if buffer is None:
+            buffer = bytearray(MAX_PACKET_SIZE)
+        pack_entry = ENTRY_STRUCT.pack_into
         packets = []
 
-        packet = self.empty_rip_packet()
-        packet += rip_entry(destination_router_id, INFINITE_METRIC) # always add the receiver as a rip entry with inf metric
+        buffer[:4] = self.header
+        pack_entry(buffer, 4, 2, 0, destination_router_id, 0, INFINITE_METRIC) # always add the receiver as a rip entry with inf metric
+        offset = 4 + 20
 
         for destination, entry in self.routing_table.items():
             metric = entry.metric
@@ -196,80 +335,67 @@ class RipManager:
                 else:
                     continue # don't add the entry
 
-            if len(packet) >= (4 + 20*25): # if 25 entries
-                packets.append(packet)
-                packet = self.empty_rip_packet()
+            if offset == MAX_PACKET_SIZE: # if 25 entries
+                packets.append(bytes(buffer))
+                offset = 4
 
-            packet += rip_entry(destination, metric)
+            pack_entry(buffer, offset, 2, 0, destination, 0, metric)
+            offset += 20
 
-        packets.append(packet)
+        packets.append(bytes(memoryview(buffer)[:offset]))
         return packets
 
 
-    def empty_rip_packet(self):
-        """Return an empty rip packet (headers only).
-        RFC all-zeros field is used for the routerid by assignment specs.
-        """
-        packet = bytearray(4)
-        packet[0] = 2 # command
-        packet[1] = 2 # version
-        packet[2:4] = self.our_routerid.to_bytes(2)
-        return packet
-
-
-def rip_entry(destination, metric):
-    """Return a rip entry for use in a rip packet."""
-    entry = bytearray(20)
-    entry[0:2] = (2).to_bytes(2) # address family identifier
-    entry[4:8] = destination.to_bytes(4)
-    entry[16:20] = metric.to_bytes(4)
-    return entry
-
-
 class RoutingTableEntry:
     """A single entry for use in the routing table.
     The RFC's 'garbage-collection' is called 'deletion' here.
     Route change flags are not used due to us not sending triggered
     updates for route metric changes according to the RIP assignment.
+    Times are time.monotonic() values, and methods take the current
+    time as now so that a caller handling many entries only reads the
+    clock once.
     """
+    __slots__ = ('next_hop', 'metric', 'time_update_due', 'time_deletion_due', 'timer_due')
 
-    def __init__(self, next_hop, metric):
+    def __init__(self, next_hop, metric, now):
         self.next_hop = next_hop
         self.metric = metric
-        self.time_update_due = time.time() + ENTRY_TIMEOUT_DELAY
+        self.time_update_due = now + ENTRY_TIMEOUT_DELAY
         self.time_deletion_due = None
+        self.timer_due = None # deadline of the entry's live timer in the RipManager
 
 
     def deletion_process_underway(self):
         return self.time_deletion_due != None
 
 
-    def over_halfway_to_update_due(self):
-        due_in = self.time_update_due - time.time()
+    def over_halfway_to_update_due(self, now):
+        due_in = self.time_update_due - now
         return due_in <= ENTRY_TIMEOUT_DELAY/2
 
 
-    def update_due_in(self):
+    def update_due_in(self, now):
         """Time in seconds until an update is due."""
-        due_in = self.time_update_due - time.time()
+        due_in = self.time_update_due - now
         return max(0, due_in)
 
 
-    def deletion_due_in(self):
+    def deletion_due_in(self, now):
         """Time in seconds until deletion is due."""
         due_in = math.inf
         if self.deletion_process_underway():
-            due_in = self.time_deletion_due - time.time()
+            due_in = self.time_deletion_due - now
         return max(0, due_in)
 
 
-    def next_timeout(self):
-        """Return the time in seconds (as a float) until the next timeout."""
-        smallest_time = min(self.update_due_in(), self.deletion_due_in())
-        return max(0, smallest_time)
+    def next_deadline(self):
+        """Time the entry should next be checked for a timeout."""
+        if self.deletion_process_underway():
+            return self.time_deletion_due
+        return self.time_update_due
 
 
-    def update_entry(self, next_hop, new_metric):
+    def update_entry(self, next_hop, new_metric, now):
         """If the deletion process is underway for a route, replace it.
         If the new metric is 16 then don't add it (no better than current).
         Return a string describing the reason for change.
@@ -292,43 +418,88 @@ class RoutingTableEntry:
         # RFC section 3.9.2 heuristic
         elif (new_metric != INFINITE_METRIC and
               new_metric == self.metric and
-              self.over_halfway_to_update_due()):
+              self.over_halfway_to_update_due(now)):
             update_timeouts = True
             reason = f'updated next-hop from {self.next_hop} ({self.metric}) to {next_hop} ({new_metric}) (over halfway to update due)'
             self.next_hop = next_hop
             self.metric = new_metric
 
         if update_timeouts:
-            self.time_update_due = time.time() + ENTRY_TIMEOUT_DELAY
+            self.time_update_due = now + ENTRY_TIMEOUT_DELAY
             if self.metric < INFINITE_METRIC:
                 self.time_deletion_due = None
 
         return reason
 
 
-    def should_begin_deletion(self):
+    def should_begin_deletion(self, now):
         """Return True if the deletion process should be started.
         Deletion process should not be started if it is already underway.
         """
         if not self.deletion_process_underway():
             return (self.metric >= INFINITE_METRIC or
-                    time.time() >= self.time_update_due)
+                    now >= self.time_update_due)
         return False
 
 
-    def begin_deletion(self):
+    def begin_deletion(self, now):
         assert self.deletion_process_underway() is False
         self.metric = INFINITE_METRIC
-        self.time_deletion_due = time.time() + GARBAGE_COLLECTION_DELAY
+        self.time_deletion_due = now + GARBAGE_COLLECTION_DELAY
 
 
-    def should_delete(self):
+    def should_delete(self, now):
         """Return True if this entry should be deleted immediately."""
         if self.deletion_process_underway():
-            return time.time() >= self.time_deletion_due
+            return now >= self.time_deletion_due
         return False
 
 
+def decode_packet(packet):
+    """Return (routerid, [(routerid, metric), ...]) for a RIP packet.
+    Raise an AssertionError if the packet is invalid. Invalid rip
+    entries are left out. All entries are unpacked in a single pass,
+    without creating a RipEntry for each.
+    """
+    routerid = validate_rip_packet(packet)
+    entries = []
+    for fields in ENTRY_STRUCT.iter_unpack(memoryview(packet)[4:]):
+        try:
+            entries.append(validate_rip_entry(fields))
+        except AssertionError as e:
+            debug('RIP packet entry error: %s', e)
+    return routerid, entries
+
+
+def validate_rip_packet(packet):
+    """Return the packet's routerid, raise an AssertionError if the
+    packet is invalid. Does not check the validity of the contained
+    rip entries.
+    """
+    length = len(packet)
+    assert 4+20 <= length <= MAX_PACKET_SIZE and (length - 4) % 20 == 0, \
+        f"packet length invalid: {length}"
+    command, version, routerid = HEADER_STRUCT.unpack_from(packet)
+    assert command == 2, "command field not 2"
+    assert version == 2, "version field not 2"
+    assert MIN_ROUTERID <= routerid <= MAX_ROUTERID, f"router-id invalid {routerid}"
+    return routerid
+
+
+def validate_rip_entry(fields):
+    """Return (routerid, metric) from the unpacked fields of a rip
+    entry, raise an AssertionError if the rip entry is invalid.
+    """
+    address_family, zeros1, routerid, zeros2, metric = fields
+    assert address_family == 2, "address family must be 2"
+    assert zeros1 == 0, "field must be all zeros"
+    # the *_is_valid range checks, inlined as this runs for every entry
+    assert MIN_ROUTERID <= routerid <= MAX_ROUTERID, f"router-id invalid {routerid}"
+    assert zeros2 == 0, "field must be all zeros"
+    assert MIN_METRIC <= metric <= MAX_METRIC, f"metric invalid {metric}"
+    return routerid, metric
+
+
 class RipPacket:
     """This class represents a validated RIP request packet.
     If a RIP packet entry is invalid, ignore it.
@@ -337,38 +508,18 @@ class RipPacket:
     2 bytes - routerid (all-zeros in RIP RFC)
     20 bytes - rip entry (1 to 25 lots of these)
     """
+    __slots__ = ('routerid', 'entries')
+
     def __init__(self, packet):
-        self.validate_rip_packet(packet)
-        self.routerid = int.from_bytes(packet[2:4])
-        self.entries = []
-        for i in range(4, len(packet), 20):
-            try:
-                self.entries.append(RipEntry(packet[i: i+20]))
-            except AssertionError as e:
-                debug(f'RIP packet entry error: {e}')
+        self.routerid, entries = decode_packet(packet)
+        self.entries = [RipEntry(routerid, metric) for routerid, metric in entries]
 
     def __str__(self):
-        lines = f'''packet:
-    Source: {self.routerid}'''
-        for entry in self.entries:
-            lines += f"""
-        {entry}"""
+        lines = ['packet:', f'    Source: {self.routerid}']
+        lines.extend(f'        {entry}' for entry in self.entries)
         if not self.entries:
-            lines += f"""
-        <EMPTY PACKET>"""
-        return lines + '\n'
-
-    def validate_rip_packet(self, packet):
-        """Raise an AssertionError if the packet is invalid.
-        Does not check the validity of the contained rip entries.
-        """
-        assert len(packet) >= 4+20, f"packet length invalid: {len(packet)}"
-        assert len(packet) <= 4+20*25, f"packet length invalid: {len(packet)}"
-        assert (len(packet) - 4) % 20 == 0, f"packet length invalid: {len(packet)}"
-        assert packet[0] == 2, "command field not 2"
-        assert packet[1] == 2, "version field not 2"
-        routerid = int.from_bytes(packet[2:4])
-        assert routerid_is_valid(routerid), f"router-id invalid {routerid}"
+            lines.append('        <EMPTY PACKET>')
+        return '\n'.join(lines) + '\n'
 
 
 class RipEntry:
@@ -379,21 +530,17 @@ class RipEntry:
     8 bytes - all zeros
     4 bytes - metric
     """
-    def __init__(self, entry):
-        self.validate_rip_entry(entry)
-        self.routerid = int.from_bytes(entry[4:8])
-        self.metric = int.from_bytes(entry[16:20])
+    __slots__ = ('routerid', 'metric')
+
+    def __init__(self, routerid, metric):
+        self.routerid = routerid
+        self.metric = metric
 
     def __str__(self):
         return f'router-id: {self.routerid} metric: {self.metric}'
 
-    def validate_rip_entry(self, entry):
-        """Raise an AssertionError if the rip entry is invalid."""
-        assert len(entry) == 20, "RIP entry length not 20"
-        assert int.from_bytes(entry[0:2]) == 2, "address family must be 2"
-        assert int.from_bytes(entry[2:4]) == 0, "field must be all zeros"
-        routerid = int.from_bytes(entry[4:8])
-        assert routerid_is_valid(routerid), f"router-id invalid {routerid}"
-        assert int.from_bytes(entry[8:16]) == 0, "field must be all zeros"
-        metric = int.from_bytes(entry[16:20])
-        assert metric_is_valid(metric), f"metric invalid {metric}"
+
+if __name__ == '__main__':
+    import doctest
+    results = doctest.testmod()
+    print(results)
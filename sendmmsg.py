@@ -0,0 +1,92 @@
+'''Batched UDP sending using Linux's sendmmsg system call, which sends
+many datagrams in a single system call. Falls back to one sendto call
+per datagram on other platforms or if sendmmsg can't be loaded.
+'''
+
+import ctypes
+import os
+import socket
+import struct
+import sys
+
+
+MAX_BATCH = 64 # messages per sendmmsg call, larger batches gain little
+
+
+class IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(IoVec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def load_sendmmsg():
+    """Return libc's sendmmsg function, or None if it isn't available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    func.restype = ctypes.c_int
+    return func
+
+libc_sendmmsg = load_sendmmsg()
+
+
+sockaddrs = {} # {(host, port): sockaddr_in buffer}
+
+def sockaddr_in(address):
+    """Return a (cached) struct sockaddr_in buffer for an IPv4 address."""
+    sockaddr = sockaddrs.get(address)
+    if sockaddr is None:
+        host, port = address
+        packed = struct.pack('=HH4s8x', socket.AF_INET, socket.htons(port), socket.inet_aton(host))
+        sockaddr = ctypes.create_string_buffer(packed, len(packed))
+        sockaddrs[address] = sockaddr
+    return sockaddr
+
+
+def send_all(sock, messages):
+    """Send each (data, (host, port)) in messages on the UDP socket sock."""
+    if libc_sendmmsg is None:
+        for data, address in messages:
+            sock.sendto(data, address)
+        return
+
+    for start in range(0, len(messages), MAX_BATCH):
+        batch = messages[start:start + MAX_BATCH]
+        buffers = [ctypes.c_char_p(bytes(data)) for data, _ in batch] # must outlive the call
+        iovecs = (IoVec * len(batch))()
+        headers = (MMsgHdr * len(batch))()
+        for i, (data, address) in enumerate(batch):
+            iovecs[i].iov_base = ctypes.cast(buffers[i], ctypes.c_void_p)
+            iovecs[i].iov_len = len(data)
+            sockaddr = sockaddr_in(address)
+            header = headers[i].msg_hdr
+            header.msg_name = ctypes.addressof(sockaddr)
+            header.msg_namelen = ctypes.sizeof(sockaddr)
+            header.msg_iov = ctypes.pointer(iovecs[i])
+            header.msg_iovlen = 1
+
+        sent = libc_sendmmsg(sock.fileno(), headers, len(batch), 0)
+        if sent < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        for data, address in batch[sent:]:
+            sock.sendto(data, address) # raises the error that stopped sendmmsg, if any